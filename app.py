@@ -1,17 +1,200 @@
 import streamlit as st
 from deta import Deta
 import datetime
+import http.client
+import queue
+import urllib.error
 import uuid
 
 # ---------------------------
 # Deta Base Setup
 # ---------------------------
 # Set your Deta project key in Streamlit Cloud Secrets as DETA_PROJECT_KEY
-deta = Deta(st.secrets["DETA_PROJECT_KEY"])
+# The client and bases are cached per process so every rerun reuses the same
+# objects (and their keep-alive HTTPS connections) instead of rebuilding them.
+@st.cache_resource
+def get_deta():
+    return Deta(st.secrets["DETA_PROJECT_KEY"])
+
+def is_transport_error(err):
+    # HTTPError subclasses OSError, but the response was received, so the
+    # connection is still usable
+    if isinstance(err, urllib.error.HTTPError):
+        return False
+    return isinstance(err, (OSError, http.client.HTTPException))
+
+class BasePool:
+    # A Deta Base holds a single keep-alive connection that is not safe to
+    # share between threads, and every Streamlit session reruns on its own
+    # thread. Each call borrows an idle Base (creating one if none is free)
+    # and returns it afterwards, so connections are reused but never shared.
+    # A Base is only returned after a success or an HTTP-level error; after a
+    # transport failure (timeout, reset) its connection can be stuck mid-
+    # request for good, so it is dropped and the next borrower gets a new one.
+    def __init__(self, name):
+        self.name = name
+        self._idle = queue.SimpleQueue()
+        base = self._borrow()
+        self.util = base.util
+        self._idle.put(base)
+
+    def _borrow(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return get_deta().Base(self.name)
+
+    def __getattr__(self, attr):
+        def call(*args, **kwargs):
+            base = self._borrow()
+            try:
+                result = getattr(base, attr)(*args, **kwargs)
+            except Exception as err:
+                if not is_transport_error(err):
+                    self._idle.put(base)
+                raise
+            self._idle.put(base)
+            return result
+        return call
+
+@st.cache_resource
+def get_base(name):
+    return BasePool(name)
 
 # Initialize the bases (collections)
-orders_db = deta.Base("orders")
-stock_db = deta.Base("stock")
+orders_db = get_base("orders")
+stock_db = get_base("stock")
+
+# Deta Base only indexes the key and returns items in ascending key order.
+# Stock is keyed by lot number for direct lookups; orders get a key built
+# from a reversed timestamp so orders created with these keys list newest
+# first among themselves. Older orders keep their random uuid4 keys and
+# sort around them by hex prefix, so the listing as a whole is not strictly
+# chronological.
+def new_order_key():
+    micros = int(datetime.datetime.now().timestamp() * 1_000_000)
+    return f"{10**16 - micros:016d}-{uuid.uuid4().hex[:8]}"
+
+# ---------------------------
+# Cached, Paginated Reads
+# ---------------------------
+PAGE_SIZE = 50
+
+# Each call returns one page plus Deta's `last` cursor for the next page, so
+# a rerun only downloads PAGE_SIZE items and repeat visits hit the cache.
+# Call .clear() on the matching reader after every write to that base.
+@st.cache_data(ttl=30, show_spinner=False)
+def list_orders(cursor=None):
+    res = orders_db.fetch(limit=PAGE_SIZE, last=cursor)
+    return res.items, res.last
+
+@st.cache_data(ttl=30, show_spinner=False)
+def list_stock(cursor=None):
+    res = stock_db.fetch(limit=PAGE_SIZE, last=cursor)
+    return res.items, res.last
+
+def load_pages(state_key, list_page):
+    # session_state holds how many pages are shown; the cursors are chained
+    # from the first page each rerun so they stay valid after writes
+    pages = st.session_state.setdefault(state_key, 1)
+    items, cursor = [], None
+    for _ in range(pages):
+        page, cursor = list_page(cursor)
+        items.extend(page)
+        if cursor is None:
+            break
+    return items, cursor
+
+def _load_more(state_key):
+    st.session_state[state_key] += 1
+
+def load_more_button(state_key, next_cursor):
+    if next_cursor is not None:
+        st.button("Load more", key=f"{state_key}_more",
+                  on_click=_load_more, args=(state_key,))
+
+# ---------------------------
+# Stock Writes
+# ---------------------------
+# The Deta SDK raises urllib.error.HTTPError for non-2xx responses other
+# than 404, and timeouts surface as TimeoutError; only a 404 is turned into
+# a bare Exception, which can only be recognised by its message.
+def is_not_found(err):
+    return "not found" in str(err)
+
+def is_conflict(err):
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code == 409
+    return "already exists" in str(err)
+
+def add_stock(lot_no, product_description, quantity):
+    # Increment existing stock in one call and only create the lot when
+    # update() reports it missing. If another session creates it first,
+    # insert() conflicts and the increment is retried. Any other failure
+    # propagates to the caller.
+    increment = {"product_description": product_description,
+                 "quantity": stock_db.util.increment(quantity)}
+    try:
+        stock_db.update(increment, lot_no)
+    except Exception as err:
+        if not is_not_found(err):
+            raise
+        try:
+            stock_db.insert({"key": lot_no, "product_description": product_description, "quantity": quantity})
+        except Exception as err:
+            if not is_conflict(err):
+                raise
+            stock_db.update(increment, lot_no)
+    finally:
+        list_stock.clear()
+
+def restore_stock(lot_no, quantity):
+    # Give back a deduction; returns False if Deta couldn't apply it
+    try:
+        stock_db.update({"quantity": stock_db.util.increment(quantity)}, lot_no)
+    except Exception:
+        return False
+    finally:
+        list_stock.clear()
+    return True
+
+def deduct_stock(lot_no, quantity):
+    # Deduct atomically on the server first, then validate the resulting
+    # quantity, so two orders racing for the same lot can't both pass a
+    # stale check. The tradeoff: an oversized order leaves the quantity
+    # briefly negative until it is given back, and a concurrent order that
+    # would have fit can be rejected during that window. Returns an error
+    # message, or None once the stock has been deducted.
+    try:
+        stock_db.update({"quantity": stock_db.util.increment(-quantity)}, lot_no)
+    except Exception as err:
+        if is_not_found(err):
+            return f"Stock for lot '{lot_no}' not found."
+        return f"Could not update stock for lot '{lot_no}': {err}"
+    finally:
+        list_stock.clear()
+    try:
+        remaining = stock_db.get(lot_no)["quantity"]
+    except Exception as err:
+        error = f"Could not check stock for lot '{lot_no}' ({err})."
+    else:
+        if remaining >= 0:
+            return None
+        error = f"Not enough stock for lot '{lot_no}'. Available: {max(0, remaining + quantity)}"
+    if not restore_stock(lot_no, quantity):
+        error += f" The deducted {quantity} could not be given back to lot '{lot_no}'."
+    return error
+
+def order_was_saved(order_id, err):
+    # An HTTPError means Deta rejected the put. Any other failure, such as a
+    # timeout, may have happened after the order was stored, so look it up
+    # by its client-generated key. Returns None if that can't be told.
+    if isinstance(err, urllib.error.HTTPError):
+        return False
+    try:
+        return orders_db.get(order_id) is not None
+    except Exception:
+        return None
 
 # ---------------------------
 # App Title & Sidebar Navigation
@@ -25,19 +208,23 @@ menu = st.sidebar.radio("Menu", ["View Orders", "New Order", "Update Stock", "Vi
 # ---------------------------
 if menu == "View Orders":
     st.header("Orders")
-    orders = orders_db.fetch().items
+    orders, next_cursor = load_pages("orders_pages", list_orders)
     if orders:
-        for order in orders:
-            st.subheader(f"Order ID: {order.get('key')}")
-            st.write("Party Name:", order.get("party_name"))
-            st.write("Gadi No:", order.get("gadi_no"))
-            st.write("Order Date:", order.get("order_date"))
-            st.write("Items:")
-            for item in order.get("items", []):
-                st.write(f"- Lot: {item.get('lot_no')} | Quantity: {item.get('quantity')} | Description: {item.get('product_description')}")
-            st.markdown("---")
+        # One row per order item, rendered as a single table
+        rows = [{"Order ID": order.get("key"),
+                 "Party Name": order.get("party_name"),
+                 "Gadi No": order.get("gadi_no"),
+                 "Order Date": order.get("order_date"),
+                 "Lot": item.get("lot_no"),
+                 "Quantity": item.get("quantity"),
+                 "Description": item.get("product_description")}
+                for order in orders
+                # Orders without items still get a row, with blank item columns
+                for item in order.get("items") or [{}]]
+        st.dataframe(rows, hide_index=True)
     else:
         st.write("No orders found.")
+    load_more_button("orders_pages", next_cursor)
 
 # ---------------------------
 # New Order
@@ -50,23 +237,18 @@ elif menu == "New Order":
         order_date = st.text_input("Order Date (YYYY-MM-DD HH:MM)", 
                                    value=datetime.datetime.now().strftime("%Y-%m-%d %H:%M"))
         st.markdown("### Order Item")
-        lot_no = st.text_input("Lot No")
+        lot_no = st.text_input("Lot No").strip()
         quantity = st.number_input("Quantity", min_value=1, value=1)
         product_description = st.text_input("Product Description")
         submitted = st.form_submit_button("Create Order")
-        if submitted:
-            # Validate stock for the provided lot_no
-            stock_item = stock_db.get(lot_no)
-            if not stock_item:
-                st.error(f"Stock for lot '{lot_no}' not found.")
-            elif stock_item.get("quantity", 0) < quantity:
-                st.error(f"Not enough stock for lot '{lot_no}'. Available: {stock_item.get('quantity')}")
+        # Reject a blank lot before making any Deta calls
+        if submitted and not lot_no:
+            st.error("Lot No is required.")
+        elif submitted:
+            error = deduct_stock(lot_no, quantity)
+            if error:
+                st.error(error)
             else:
-                # Deduct stock
-                new_stock_qty = stock_item["quantity"] - quantity
-                stock_db.put({"key": lot_no, 
-                              "product_description": stock_item["product_description"],
-                              "quantity": new_stock_qty})
                 # Create order
                 order_data = {
                     "party_name": party_name,
@@ -78,9 +260,28 @@ elif menu == "New Order":
                         "product_description": product_description
                     }]
                 }
-                order_id = str(uuid.uuid4())
-                orders_db.put({"key": order_id, **order_data})
-                st.success("Order created successfully.")
+                order_id = new_order_key()
+                try:
+                    orders_db.put({"key": order_id, **order_data})
+                except Exception as err:
+                    saved = order_was_saved(order_id, err)
+                    if saved:
+                        list_orders.clear()
+                        st.success("Order created successfully.")
+                    elif saved is None:
+                        list_orders.clear()
+                        st.error(f"Could not confirm whether order {order_id} was saved ({err}). "
+                                 f"Stock for lot '{lot_no}' is still deducted; check View Orders before retrying.")
+                    # Deta has no transactions: undo the deduction so stock
+                    # isn't lost for an order that was confirmed not saved
+                    elif restore_stock(lot_no, quantity):
+                        st.error(f"Could not save the order ({err}). Stock has been restored.")
+                    else:
+                        st.error(f"Could not save the order ({err}). The deducted {quantity} "
+                                 f"could not be given back to lot '{lot_no}'.")
+                else:
+                    list_orders.clear()
+                    st.success("Order created successfully.")
 
 # ---------------------------
 # Update Stock
@@ -88,28 +289,32 @@ elif menu == "New Order":
 elif menu == "Update Stock":
     st.header("Update Stock")
     with st.form("stock_form"):
-        lot_no = st.text_input("Lot No")
+        lot_no = st.text_input("Lot No").strip()
         product_description = st.text_input("Product Description")
         quantity = st.number_input("Quantity to Add", min_value=1, value=1)
         submitted = st.form_submit_button("Update Stock")
-        if submitted:
-            # If stock exists, update it; otherwise, create new stock
-            stock_item = stock_db.get(lot_no)
-            if stock_item:
-                new_qty = stock_item["quantity"] + quantity
-                stock_db.put({"key": lot_no, "product_description": product_description, "quantity": new_qty})
+        if submitted and not lot_no:
+            st.error("Lot No is required.")
+        elif submitted:
+            try:
+                add_stock(lot_no, product_description, quantity)
+            except Exception as err:
+                st.error(f"Could not update stock for lot '{lot_no}': {err}")
             else:
-                stock_db.put({"key": lot_no, "product_description": product_description, "quantity": quantity})
-            st.success("Stock updated successfully.")
+                st.success("Stock updated successfully.")
 
 # ---------------------------
 # View Stock
 # ---------------------------
 elif menu == "View Stock":
     st.header("Stock")
-    stock_items = stock_db.fetch().items
+    stock_items, next_cursor = load_pages("stock_pages", list_stock)
     if stock_items:
-        for item in stock_items:
-            st.write(f"Lot: {item.get('key')}, Description: {item.get('product_description')}, Quantity: {item.get('quantity')}")
+        rows = [{"Lot": item.get("key"),
+                 "Description": item.get("product_description"),
+                 "Quantity": item.get("quantity")}
+                for item in stock_items]
+        st.dataframe(rows, hide_index=True)
     else:
         st.write("No stock records found.")
+    load_more_button("stock_pages", next_cursor)